@@ -120,8 +120,13 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+#  Subidas siempre a archivo temporal (se leen con mmap en lugar de cargarlas en memoria)
+FILE_UPLOAD_MAX_MEMORY_SIZE = 0
+
 #  Configuración de seguridad para producción
 if not DEBUG:
     SECURE_BROWSER_XSS_FILTER = True
     SECURE_CONTENT_TYPE_NOSNIFF = True
-    X_FRAME_OPTIONS = 'DENY'
\ No newline at end of file
+    X_FRAME_OPTIONS = 'DENY'
+    #  Render termina HTTPS en su proxy: necesario para que las URLs absolutas (histogramas) usen https
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
\ No newline at end of file
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dataset_processor.settings')
 
 application = get_wsgi_application()
+
+# Calentar el proceso solo al arrancar el servidor: migrate, collectstatic y test no
+# importan este módulo (ver processor.apps.warm_up sobre gunicorn --preload)
+from processor.apps import warm_up  # noqa: E402
+
+warm_up()
@@ -1,6 +1,24 @@
+import gc
 from django.apps import AppConfig
 
 
+def warm_up():
+    """Preparar el proceso del servidor; se llama desde wsgi.py, no en cada comando de manage.py
+
+    Con `gunicorn --preload` corre una sola vez en el proceso maestro y los workers heredan
+    sus páginas ya inicializadas; sin --preload cada worker la ejecuta al cargar la aplicación."""
+    # Importar las vistas y dibujar una gráfica de prueba al arrancar, para que el
+    # primer request no pague la carga de pandas/Pillow ni la inicialización de FreeType
+    from . import views
+    views.render_bar_chart(['tcp'], [1], 'warmup', 'protocol_type', 'skyblue')
+
+    # Los DataFrames no forman ciclos y se liberan por conteo de referencias;
+    # un umbral más alto reduce las pausas del recolector de ciclos
+    gc.set_threshold(700 * 3, 10, 10)
+    # Sacar los objetos creados al arrancar Django del conjunto que revisa el GC
+    gc.freeze()
+
+
 class ProcessorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'processor'
@@ -1,3 +1,332 @@
+import hashlib
+from io import BytesIO
+from unittest import mock
+from urllib.parse import urlsplit
+
+import numpy as np
+import orjson
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from pandas.testing import assert_frame_equal
+from sklearn.model_selection import train_test_split
+
+from . import views
+from .views import (
+    HISTOGRAM_MAX_BARS,
+    HISTOGRAM_MAX_COUNT,
+    HISTOGRAM_MAX_LABEL,
+    NSL_KDD_ATTRIBUTES,
+    load_kdd_dataset_from_file,
+    load_kdd_dataset_normal,
+    load_nsl_kdd_dataset,
+    parse_arff_fast,
+    train_val_test_split_optimized,
+)
+
+NOMINAL_VALUES = {
+    'protocol_type': ['tcp', 'udp', 'icmp'],
+    'service': ['http', 'ftp_data', 'private'],
+    'flag': ['SF', 'S0', 'REJ'],
+    'land': ['0', '1'],
+    'logged_in': ['0', '1'],
+    'is_host_login': ['0', '1'],
+    'is_guest_login': ['0', '1'],
+    'class': ['normal', 'anomaly'],
+}
+
+
+def arff_header():
+    """Header con el esquema NSL-KDD: nominales con sus valores declarados, el resto real"""
+    lines = ["% Subconjunto con formato KDD", "@relation 'KDDTest-21'", ""]
+    for name in NSL_KDD_ATTRIBUTES:
+        if name in NOMINAL_VALUES:
+            kind = '{' + ','.join(f"'{value}'" for value in NOMINAL_VALUES[name]) + '}'
+        else:
+            kind = 'real'
+        lines.append(f"@attribute '{name}' {kind}")
+    return '\n'.join(lines) + '\n\n@data\n'
+
+
+def arff_row(protocol='tcp', service='http', src_bytes='215', cls='normal'):
+    """Fila de 42 campos: nominales por defecto en su primer valor, numéricos en 0"""
+    values = {'protocol_type': protocol, 'service': service, 'src_bytes': src_bytes, 'class': cls}
+    return ','.join(values.get(name, NOMINAL_VALUES.get(name, ['0'])[0]) for name in NSL_KDD_ATTRIBUTES)
+
+
+ARFF_ROWS = [
+    arff_row(),
+    arff_row(protocol="'udp'", service='private', cls='anomaly'),
+    arff_row(protocol='icmp', service='ftp_data', src_bytes='?', cls='anomaly'),
+    "% comentario entre filas",
+    "",
+    arff_row(service='ftp_data', src_bytes='0'),
+]
+
+
+def arff_bytes(rows=ARFF_ROWS):
+    return (arff_header() + '\n'.join(rows) + '\n').encode('utf-8')
+
+
+class TrainValTestSplitTests(TestCase):
+    """División estratificada 60/20/20 hecha a mano (reemplaza los dos train_test_split)"""
+
+    def assert_partition(self, splits, n_rows):
+        self.assertTrue(all(part.dtype.kind == 'i' for part in splits))
+        np.testing.assert_array_equal(np.sort(np.concatenate(splits)), np.arange(n_rows))
+
+    def expected_sizes(self, n_rows):
+        # Mismos tamaños que train_test_split(test_size=0.4) y luego (test_size=0.5) del resto
+        train, rest = train_test_split(np.arange(n_rows), test_size=0.4, random_state=42)
+        val, test = train_test_split(rest, test_size=0.5, random_state=42)
+        return len(train), len(val), len(test)
+
+    def test_parts_partition_all_rows(self):
+        rng = np.random.default_rng(0)
+        for n_rows in (1, 2, 3, 7, 10, 101, 1000):
+            codes = rng.integers(0, 3, size=n_rows).astype(np.int8)
+            with self.subTest(n_rows=n_rows):
+                self.assert_partition(train_val_test_split_optimized(n_rows, stratify=codes), n_rows)
+
+    def test_sizes_match_train_test_split(self):
+        rng = np.random.default_rng(1)
+        # Con menos de 3 filas train_test_split deja un conjunto vacío y falla
+        for n_rows in list(range(3, 60)) + [101, 999, 1000, 22544]:
+            codes = rng.integers(0, 3, size=n_rows).astype(np.int8)
+            with self.subTest(n_rows=n_rows):
+                splits = train_val_test_split_optimized(n_rows, stratify=codes)
+                self.assertEqual(tuple(map(len, splits)), self.expected_sizes(n_rows))
+
+    def test_each_class_is_split_proportionally(self):
+        codes = np.repeat(np.array([0, 1, 2], dtype=np.int8), [600, 300, 100])
+        np.random.default_rng(2).shuffle(codes)
+        splits = train_val_test_split_optimized(len(codes), stratify=codes)
+        for part, fraction in zip(splits, (0.6, 0.2, 0.2)):
+            counts = np.bincount(codes[part], minlength=3)
+            np.testing.assert_allclose(counts, np.array([600, 300, 100]) * fraction, atol=1)
+
+    def test_is_reproducible(self):
+        codes = np.random.default_rng(3).integers(0, 3, size=500)
+        first = train_val_test_split_optimized(500, stratify=codes)
+        second = train_val_test_split_optimized(500, stratify=codes)
+        for a, b in zip(first, second):
+            np.testing.assert_array_equal(a, b)
+
+    def test_single_class(self):
+        codes = np.zeros(50, dtype=np.int8)
+        splits = train_val_test_split_optimized(50, stratify=codes)
+        self.assert_partition(splits, 50)
+        self.assertEqual(tuple(map(len, splits)), self.expected_sizes(50))
+
+    def test_without_stratify(self):
+        splits = train_val_test_split_optimized(50)
+        self.assert_partition(splits, 50)
+        self.assertEqual(tuple(map(len, splits)), self.expected_sizes(50))
+
+    def test_missing_values_are_kept(self):
+        # Los valores faltantes de una columna category tienen código -1
+        codes = np.array([0, 1, -1, 2, 0, -1, 1, 0, 2, 1, -1, 0] * 5, dtype=np.int8)
+        splits = train_val_test_split_optimized(len(codes), stratify=codes)
+        self.assert_partition(splits, len(codes))
+        self.assertEqual(tuple(map(len, splits)), self.expected_sizes(len(codes)))
+
+    def test_empty_dataset(self):
+        with self.assertRaisesMessage(Exception, 'El dataset está vacío'):
+            train_val_test_split_optimized(0, stratify=np.array([], dtype=np.int8))
+
+
+class ArffLoaderTests(TestCase):
+    """Carga rápida (header propio + pd.read_csv) contra liac-arff y la cadena de respaldo"""
+
+    def load_with_liac_arff(self, content):
+        return load_kdd_dataset_normal(iter(content.decode('utf-8').splitlines()))
+
+    def test_fast_path_matches_liac_arff(self):
+        content = arff_bytes()
+        fast = parse_arff_fast(BytesIO(content))
+        assert_frame_equal(fast, self.load_with_liac_arff(content))
+        self.assertEqual(len(fast), 4)
+        self.assertEqual(fast['duration'].dtype, np.float32)
+        self.assertTrue(np.isnan(fast.loc[2, 'src_bytes']))
+        self.assertEqual(fast['protocol_type'].cat.categories.tolist(), NOMINAL_VALUES['protocol_type'])
+        self.assertEqual(fast['protocol_type'].tolist(), ['tcp', 'udp', 'icmp', 'tcp'])
+
+    def test_fast_path_rejects_undeclared_nominal_value(self):
+        content = arff_bytes(ARFF_ROWS + [arff_row(service='weird_svc')])
+        with self.assertRaisesMessage(Exception, 'Valores no declarados'):
+            parse_arff_fast(BytesIO(content))
+
+    def test_fast_path_rejects_wrong_field_count(self):
+        content = arff_bytes(["0,tcp,http,215"] + ARFF_ROWS)
+        with self.assertRaisesMessage(Exception, 'Se esperaban 42 columnas'):
+            parse_arff_fast(BytesIO(content))
+
+    def test_fast_path_rejects_empty_dataset(self):
+        with self.assertRaisesMessage(Exception, 'El dataset está vacío'):
+            parse_arff_fast(BytesIO(arff_bytes([])))
+
+    def test_upload_uses_fast_path(self):
+        content = arff_bytes()
+        df = load_kdd_dataset_from_file(SimpleUploadedFile('test.arff', content))
+        assert_frame_equal(df, parse_arff_fast(BytesIO(content)))
+
+    def test_upload_falls_back_on_undeclared_nominal_value(self):
+        # La carga rápida y liac-arff lo rechazan; la carga NSL-KDD lo acepta con su esquema fijo
+        content = arff_bytes(ARFF_ROWS + [arff_row(service='weird_svc')])
+        df = load_kdd_dataset_from_file(SimpleUploadedFile('test.arff', content))
+        self.assertEqual(len(df), 5)
+        self.assertIn('weird_svc', df['service'].cat.categories)
+        self.assertEqual(df['protocol_type'].value_counts().to_dict(), {'tcp': 3, 'udp': 1, 'icmp': 1})
+
+    def test_upload_falls_back_on_wrong_field_count(self):
+        # La fila corta se descarta en la carga NSL-KDD
+        content = arff_bytes(["0,tcp,http,215"] + ARFF_ROWS)
+        df = load_kdd_dataset_from_file(SimpleUploadedFile('test.arff', content))
+        self.assertEqual(df['protocol_type'].tolist(), ['tcp', 'udp', 'icmp', 'tcp'])
+        self.assertNotIn('', df['protocol_type'].cat.categories)
+
+    def test_upload_without_rows_fails(self):
+        with self.assertRaisesMessage(Exception, 'No se pudo cargar el archivo ARFF'):
+            load_kdd_dataset_from_file(SimpleUploadedFile('test.arff', arff_bytes([])))
+
+    def test_upload_falls_back_on_extra_fields(self):
+        content = arff_bytes([arff_row(protocol='udp') + ',extra'] + ARFF_ROWS)
+        df = load_kdd_dataset_from_file(SimpleUploadedFile('test.arff', content))
+        self.assertEqual(df['protocol_type'].tolist(), ['tcp', 'udp', 'icmp', 'tcp'])
+        self.assertEqual(df.columns.tolist(), NSL_KDD_ATTRIBUTES)
+
+    def test_nsl_kdd_loader_keeps_only_rows_with_42_fields(self):
+        # pandas solo recorta (y conserva) la fila de 43 campos cuando es la primera
+        rows = [arff_row(protocol='udp') + ',extra'] + ARFF_ROWS + [
+            arff_row(protocol='udp') + ',extra,otro',
+            "0,udp,http,215",
+        ]
+        df = load_nsl_kdd_dataset(BytesIO(arff_bytes(rows)))
+        self.assertEqual(df['protocol_type'].tolist(), ['tcp', 'udp', 'icmp', 'tcp'])
+        self.assertEqual(df.columns.tolist(), NSL_KDD_ATTRIBUTES)
+        self.assertEqual(df['src_bytes'].dtype, np.float32)
+
+    def test_nsl_kdd_loader_coerces_text_in_numeric_columns(self):
+        # Texto en una columna numérica obliga a la segunda lectura con pd.to_numeric
+        rows = [arff_row(protocol='udp') + ',extra'] + ARFF_ROWS + [
+            arff_row(protocol='udp', src_bytes='abc'),
+            arff_row(protocol='udp') + ',extra',
+            "0,udp,http,215",
+        ]
+        df = load_nsl_kdd_dataset(BytesIO(arff_bytes(rows)))
+        self.assertEqual(df['protocol_type'].tolist(), ['tcp', 'udp', 'icmp', 'tcp', 'udp'])
+        self.assertEqual(df.columns.tolist(), NSL_KDD_ATTRIBUTES)
+        self.assertEqual(df['src_bytes'].dtype, np.float32)
+        self.assertTrue(np.isnan(df['src_bytes'].iloc[-1]))
+        self.assertNotIn('', df['protocol_type'].cat.categories)
+
+
+class HistogramViewTests(TestCase):
+    """process_dataset → URLs de los histogramas → histogram_image, con y sin caché"""
+
+    def setUp(self):
+        views._results_cache.clear()
+        self.addCleanup(views._results_cache.clear)
+        self.content = arff_bytes(ARFF_ROWS * 5)
+
+    def upload(self, content=None, **extra):
+        upload = SimpleUploadedFile('test.arff', content or self.content)
+        response = self.client.post('/api/process/', {'file': upload}, **extra)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, orjson.loads(body)
+
+    def get_image(self, url, **extra):
+        parts = urlsplit(url)
+        return self.client.get(f'{parts.path}?{parts.query}', **extra)
+
+    def test_process_returns_histogram_urls(self):
+        response, data = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['split_sizes'], {'train': 12, 'validation': 4, 'test': 4})
+        self.assertEqual(data['protocol_type_distribution']['original'], {'tcp': 10, 'udp': 5, 'icmp': 5})
+        file_hash = hashlib.blake2b(self.content, digest_size=16).hexdigest()
+        self.assertEqual(set(data['histograms']), {'train', 'validation', 'test'})
+        for split, url in data['histograms'].items():
+            self.assertTrue(url.startswith(f'http://testserver/api/histograms/{file_hash}/{split}/?'))
+            self.assertIn('column=protocol_type', url)
+
+    def test_histogram_image_from_cache(self):
+        _, data = self.upload()
+        for url in data['histograms'].values():
+            response = self.get_image(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/webp')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(response.content[8:12], b'WEBP')
+
+    def test_histogram_image_is_redrawn_on_cache_miss(self):
+        _, data = self.upload()
+        cached = {split: self.get_image(url).content for split, url in data['histograms'].items()}
+        # Otro worker, un reinicio o el LRU lleno: la URL alcanza para re-dibujar la imagen
+        views._results_cache.clear()
+        for split, url in data['histograms'].items():
+            response = self.get_image(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, cached[split])
+
+    def test_cached_results_get_urls_for_each_request(self):
+        self.upload()
+        with mock.patch.object(views, 'load_kdd_dataset_from_file') as load:
+            response, data = self.upload(HTTP_HOST='localhost', secure=True)
+        load.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        for url in data['histograms'].values():
+            self.assertTrue(url.startswith('https://localhost/api/histograms/'))
+
+    def test_failed_results_are_returned_empty_and_not_cached(self):
+        with mock.patch.object(views, 'category_counts', side_effect=ValueError('x')):
+            response, data = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data, {'split_sizes': {}, 'protocol_type_distribution': {},
+                                'histograms': {}, 'dataset_info': {}})
+        self.assertEqual(len(views._results_cache), 0)
+
+    def test_too_many_categories_skip_histograms(self):
+        with mock.patch.object(views, 'HISTOGRAM_MAX_BARS', 2):
+            response, data = self.upload()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['histograms'], {})
+        self.assertEqual(data['split_sizes'], {'train': 12, 'validation': 4, 'test': 4})
+        self.assertEqual(len(views._results_cache), 0)
+
+    def test_unknown_split_is_404(self):
+        response = self.client.get('/api/histograms/abc/otro/?column=c&label=a&count=1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_parameters_are_400(self):
+        too_long = 'a' * (HISTOGRAM_MAX_LABEL + 1)
+        queries = [
+            '',
+            'label=a&count=1',
+            'column=c&label=a',
+            'column=c&label=a&label=b&count=1',
+            'column=c&label=a&count=1.5',
+            'column=c&label=a&count=-1',
+            f'column=c&label=a&count={HISTOGRAM_MAX_COUNT + 1}',
+            'column=c&label=a&count=' + '9' * 400,
+            'column=c&label=a&count=' + '9' * 5000,
+            f'column=c&label={too_long}&count=1',
+            f'column={too_long}&label=a&count=1',
+            'column=c' + '&label=a&count=1' * (HISTOGRAM_MAX_BARS + 1),
+        ]
+        for query in queries:
+            with self.subTest(query=query[:60]):
+                response = self.client.get(f'/api/histograms/abc/train/?{query}')
+                self.assertEqual(response.status_code, 400)
+
+    def test_parameters_at_the_limits_are_drawn(self):
+        label = 'a' * HISTOGRAM_MAX_LABEL
+        query = f'column=c&label={label}&count={HISTOGRAM_MAX_COUNT}' + '&label=b&count=0' * (HISTOGRAM_MAX_BARS - 1)
+        response = self.client.get(f'/api/histograms/abc/test/?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
 
-# Create your tests here.
+    def test_process_errors(self):
+        self.assertEqual(self.client.get('/api/process/').status_code, 405)
+        response = self.client.post('/api/process/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(orjson.loads(response.content), {'error': 'No se envió ningún archivo'})
@@ -4,4 +4,5 @@ from . import views
 urlpatterns = [
     path('process/', views.process_dataset, name='process_dataset'),
     path('health/', views.health_check, name='health_check'),  # Nuevo endpoint
+    path('histograms/<str:file_hash>/<str:split>/', views.histogram_image, name='histogram_image'),
 ]
\ No newline at end of file
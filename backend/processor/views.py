@@ -1,68 +1,254 @@
-import json
 import os
-import base64
+import codecs
+import csv
+import mmap
+import re
+import hashlib
+import threading
+import numpy as np
 import pandas as pd
 import arff
-from io import StringIO, BytesIO
-from django.http import JsonResponse
+import orjson
+from io import BytesIO
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import chain
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from sklearn.model_selection import train_test_split
-import matplotlib
-matplotlib.use('Agg')  # Backend no interactivo - CRUCIAL para Render
-import matplotlib.pyplot as plt
+from PIL import Image, ImageDraw, ImageFont
 import traceback
-import gc  # Garbage collector para liberar memoria
-import psutil  # Para monitorear memoria (opcional)
+from urllib.parse import urlencode
 
-# Configuración para Render
-if 'RENDER' in os.environ:
-    # Reducir uso de memoria en Render
-    import matplotlib
-    matplotlib.use('Agg')
+# Atributos predefinidos para NSL-KDD (basado en KDDTest+.arff)
+NSL_KDD_ATTRIBUTES = [
+    'duration', 'protocol_type', 'service', 'flag', 'src_bytes', 
+    'dst_bytes', 'land', 'wrong_fragment', 'urgent', 'hot',
+    'num_failed_logins', 'logged_in', 'num_compromised', 'root_shell',
+    'su_attempted', 'num_root', 'num_file_creations', 'num_shells',
+    'num_access_files', 'num_outbound_cmds', 'is_host_login',
+    'is_guest_login', 'count', 'srv_count', 'serror_rate',
+    'srv_serror_rate', 'rerror_rate', 'srv_rerror_rate', 'same_srv_rate',
+    'diff_srv_rate', 'srv_diff_host_rate', 'dst_host_count',
+    'dst_host_srv_count', 'dst_host_same_srv_rate', 'dst_host_diff_srv_rate',
+    'dst_host_same_src_port_rate', 'dst_host_srv_diff_host_rate',
+    'dst_host_serror_rate', 'dst_host_srv_serror_rate', 'dst_host_rerror_rate',
+    'dst_host_srv_rerror_rate', 'class'
+]
+
+# Atributos nominales del esquema NSL-KDD (se cargan como category)
+NSL_KDD_NOMINAL = (
+    'protocol_type', 'service', 'flag', 'land', 'logged_in',
+    'is_host_login', 'is_guest_login', 'class'
+)
+
+# dtypes compactos del esquema NSL-KDD: category (códigos int8) y float32
+NSL_KDD_DTYPES = {
+    col: 'category' if col in NSL_KDD_NOMINAL else 'float32'
+    for col in NSL_KDD_ATTRIBUTES
+}
+
+# Columna centinela de la carga NSL-KDD: solo la llenan las filas con un campo de más
+# (con index_col=False pandas las recortaría a 42 columnas en lugar de descartarlas)
+NSL_KDD_EXTRA_FIELD = '_campo_extra'
+
+# Línea @attribute de un header ARFF: nombre (con o sin comillas) y tipo
+ARFF_ATTRIBUTE_RE = re.compile(r"""^@attribute\s+('[^']*'|"[^"]*"|\S+)\s+(.+)$""", re.IGNORECASE)
+
+# Línea @DATA que separa el header ARFF de los datos
+ARFF_DATA_RE = re.compile(r'^@data\s*$', re.IGNORECASE)
+
+# Correcciones del header para la carga permisiva: tipos en minúscula y
+# atributos nominales de NSL-KDD declarados sin su lista de valores
+ARFF_ATTRIBUTE_FIXES = [
+    (re.compile(r'^(@attribute\s.+\s)string\s*$', re.IGNORECASE | re.MULTILINE), r'\1STRING'),
+    (re.compile(r'^(@attribute\s.+\s)(?:real|integer)\s*$', re.IGNORECASE | re.MULTILINE), r'\1NUMERIC'),
+] + [
+    (re.compile(rf"""^@attribute\s+['"]?{name}['"]?\s+[^{{\n]*$""", re.IGNORECASE | re.MULTILINE),
+     f'@ATTRIBUTE {name} {{{values}}}')
+    for name, values in (
+        ('protocol_type', 'tcp,udp,icmp'),
+        ('service', 'http,ftp,smtp,ssh,dns,other'),
+        ('flag', 'SF,S1,S2,S3,S0,OTH'),
+        ('land', '0,1'),
+        ('logged_in', '0,1'),
+        ('is_host_login', '0,1'),
+        ('is_guest_login', '0,1'),
+    )
+]
+
+# Opciones de pd.read_csv para la sección @DATA de un ARFF
+ARFF_CSV_OPTIONS = dict(
+    header=None, na_values=['?'], keep_default_na=False, quotechar="'",
+    skipinitialspace=True, comment='%', index_col=False, engine='c'
+)
+
+# (clave, título, color) de cada histograma
+HISTOGRAM_SPLITS = (
+    ('train', 'Training Set', 'skyblue'),
+    ('validation', 'Validation Set', 'orange'),
+    ('test', 'Test Set', 'lightgreen'),
+)
+HISTOGRAM_STYLES = {split: (title, color) for split, title, color in HISTOGRAM_SPLITS}
+
+# Límites de los histogramas: se aplican al generarlos y al re-dibujarlos desde su URL
+HISTOGRAM_MAX_BARS = 100
+HISTOGRAM_MAX_LABEL = 64
+HISTOGRAM_MAX_COUNT = 10 ** 9
+
+# Caché LRU de respuestas (y sus imágenes), indexada por el hash del contenido del archivo.
+# Es local a cada worker: las URLs de los histogramas llevan los conteos para re-dibujarlos
+RESULTS_CACHE_SIZE = 32
+_results_cache = OrderedDict()
+_results_cache_lock = threading.Lock()
+
+# Monitoreo de memoria solo con DEBUG_MEM=1 (psutil ni siquiera se importa sin él)
+DEBUG_MEM = bool(os.environ.get('DEBUG_MEM'))
+
+# Proceso de psutil reutilizado entre requests (se crea en el primer uso, ya dentro del worker)
+_process = None
+
+# Fuentes de las gráficas: se cargan una vez por proceso y se comparten entre requests/hilos
+CHART_FONT = ImageFont.load_default(size=12)
+CHART_TITLE_FONT = ImageFont.load_default(size=16)
+
+# Tamaño del lienzo y márgenes (izquierda, derecha, arriba, abajo) de las gráficas
+CHART_SIZE = (640, 320)
+CHART_MARGINS = (70, 20, 56, 60)
 
 def get_memory_usage():
     """Monitorear uso de memoria (útil para debug en Render)"""
+    global _process
+    if not DEBUG_MEM:
+        return 0.0
     try:
-        process = psutil.Process()
-        return process.memory_info().rss / 1024 / 1024  # MB
+        if _process is None:
+            import psutil  # Para monitorear memoria (opcional)
+            _process = psutil.Process()
+        return _process.memory_info().rss / 1024 / 1024  # MB
     except:
         return 0  # Fallback si psutil no está disponible
 
+def log_memory(stage):
+    """Imprimir uso de memoria solo con DEBUG_MEM (evita la syscall en producción)"""
+    if DEBUG_MEM:
+        print(f"Memoria {stage}: {get_memory_usage():.2f} MB")
+
+class HashingUploadHandler(FileUploadHandler):
+    """Calcular la huella blake2b de cada archivo mientras Django recibe la subida
+    
+    Deja pasar los chunks al siguiente handler (el que escribe el archivo temporal) y
+    guarda la huella en `request.upload_hashes[campo]`: no hay una lectura extra del archivo."""
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not hasattr(self.request, 'upload_hashes'):
+            self.request.upload_hashes = {}
+        self.request.upload_hashes[self.field_name] = self.digest.hexdigest()
+        return None
+
+def get_cached_entry(file_hash):
+    """Buscar resultados previos (con las imágenes de sus histogramas) para el mismo contenido"""
+    with _results_cache_lock:
+        entry = _results_cache.get(file_hash)
+        if entry is not None:
+            _results_cache.move_to_end(file_hash)
+        return entry
+
+def cache_results(file_hash, results):
+    """Guardar resultados (con sus imágenes, sin URLs), descartando los menos usados"""
+    with _results_cache_lock:
+        _results_cache[file_hash] = results
+        _results_cache.move_to_end(file_hash)
+        while len(_results_cache) > RESULTS_CACHE_SIZE:
+            _results_cache.popitem(last=False)
+
+# Escalares/arreglos numpy y llaves no-str (categorías numéricas) se serializan sin convertir
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+class OrjsonResponse(HttpResponse):
+    """Como JsonResponse, pero serializando con orjson (acepta escalares y arreglos de numpy)"""
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(orjson.dumps(data, option=ORJSON_OPTIONS), **kwargs)
+
+def stream_results(results):
+    """Serializar la respuesta por secciones con orjson"""
+    yield b'{'
+    for i, (key, value) in enumerate(results.items()):
+        if i:
+            yield b','
+        yield orjson.dumps(key) + b':'
+        yield orjson.dumps(value, option=ORJSON_OPTIONS)
+    yield b'}'
+
+def results_response(request, file_hash, results):
+    """Respuesta JSON en streaming (evita armar todo el cuerpo en un solo bytes)
+    
+    Las imágenes se reemplazan por sus URLs, armadas con el host y esquema de este request."""
+    urls = histogram_urls(request, file_hash, results)
+    payload = {key: urls if key == 'histograms' else value for key, value in results.items()}
+    return StreamingHttpResponse(stream_results(payload), content_type='application/json')
+
+def histogram_urls(request, file_hash, results):
+    """URLs absolutas de los histogramas (el frontend se sirve desde otro dominio)
+    
+    Cada URL lleva la columna, etiquetas y conteos de su gráfica, así cualquier worker
+    puede re-dibujarla aunque la imagen no esté en su caché."""
+    # Si fallaron los resultados o las gráficas no hay nada que enlazar
+    images = results['histograms']
+    if not images:
+        return {}
+    column = chart_text(results['dataset_info']['stratify_column_used'])
+    urls = {}
+    for split in images:
+        params = [('column', column)]
+        for label, count in results['protocol_type_distribution'][split].items():
+            params += [('label', chart_text(label)), ('count', int(count))]
+        path = reverse('histogram_image', args=[file_hash, split])
+        urls[split] = request.build_absolute_uri(f'{path}?{urlencode(params)}')
+    return urls
+
 @csrf_exempt
 def process_dataset(request):
     if request.method == 'POST':
         try:
-            print(f"Memoria inicial: {get_memory_usage():.2f} MB")
+            log_memory('inicial')
+            
+            # Antes de leer request.FILES: la huella se calcula mientras llega la subida
+            request.upload_handlers.insert(0, HashingUploadHandler(request))
             
             if 'file' not in request.FILES:
-                return JsonResponse({'error': 'No se envió ningún archivo'}, status=400)
+                return OrjsonResponse({'error': 'No se envió ningún archivo'}, status=400)
             
             file = request.FILES['file']
             
             # Validar tamaño del archivo (máximo 10MB para plan gratuito)
             if file.size > 10 * 1024 * 1024:
-                return JsonResponse({'error': 'El archivo es demasiado grande. Máximo 10MB.'}, status=400)
+                return OrjsonResponse({'error': 'El archivo es demasiado grande. Máximo 10MB.'}, status=400)
             
             print(f"Procesando archivo: {file.name} ({file.size / 1024 / 1024:.2f} MB)")
             
-            # Leer y procesar en chunks si es necesario
-            content = file.read().decode('utf-8')
-            
-            # Liberar memoria del archivo inmediatamente
-            del file
-            gc.collect()
-            
-            print(f"Memoria después de leer archivo: {get_memory_usage():.2f} MB")
+            # Re-subir el mismo archivo regresa la respuesta ya calculada
+            file_hash = request.upload_hashes['file']
+            cached = get_cached_entry(file_hash)
+            if cached is not None:
+                print(f"Resultados en caché para {file_hash}")
+                return results_response(request, file_hash, cached)
             
-            # Cargar dataset con métodos robustos
-            df = load_kdd_dataset_from_content(content)
+            # Cargar dataset leyendo el archivo por chunks (sin decodificarlo completo en memoria)
+            df = load_kdd_dataset_from_file(file)
             print(f"Dataset cargado: {df.shape}")
             
-            # Liberar contenido original
-            del content
-            gc.collect()
-            
-            print(f"Memoria después de cargar dataset: {get_memory_usage():.2f} MB")
+            log_memory('después de cargar dataset')
             
             # Validar que existe la columna para stratify
             if 'protocol_type' not in df.columns:
@@ -72,89 +258,180 @@ def process_dataset(request):
                     print(f"Usando columna alternativa para stratify: {protocol_cols[0]}")
                     stratify_col = protocol_cols[0]
                 else:
-                    return JsonResponse({'error': 'El dataset debe contener la columna "protocol_type" para realizar la división estratificada'}, status=400)
+                    return OrjsonResponse({'error': 'El dataset debe contener la columna "protocol_type" para realizar la división estratificada'}, status=400)
             else:
                 stratify_col = 'protocol_type'
             
-            # Realizar divisiones con manejo de memoria
-            train_set, val_set, test_set = train_val_test_split_optimized(df, stratify=stratify_col)
+            # Columna de estratificación como códigos enteros + etiquetas (no se copian filas)
+            strat = as_categorical(df[stratify_col])
+            codes = strat.cat.codes.to_numpy()
+            categories = strat.cat.categories.tolist()
+            features_count = len(df.columns)
+            
+            # Realizar divisiones con manejo de memoria (solo índices)
+            splits = train_val_test_split_optimized(len(df), stratify=codes)
             
-            # Liberar dataframe original
-            del df
-            gc.collect()
+            # Liberar dataframe original (el conteo de referencias lo libera de inmediato)
+            del df, strat
             
-            print(f"Memoria después de dividir dataset: {get_memory_usage():.2f} MB")
+            log_memory('después de dividir dataset')
             
             # Generar resultados de forma eficiente
-            results = generate_optimized_results(train_set, val_set, test_set, stratify_col)
+            results = generate_optimized_results(splits, codes, categories, features_count, stratify_col)
             
-            # Liberar datasets divididos
-            del train_set, val_set, test_set
-            gc.collect()
+            # Solo se guardan en caché resultados completos (con sus histogramas); la
+            # respuesta lleva las URLs de las imágenes en lugar de los bytes
+            if results['split_sizes'] and results['histograms']:
+                cache_results(file_hash, results)
             
-            print(f"Memoria final: {get_memory_usage():.2f} MB")
+            log_memory('final')
             print("Procesamiento completado exitosamente")
             
-            return JsonResponse(results)
+            return results_response(request, file_hash, results)
             
         except MemoryError:
             error_msg = "Error de memoria: El dataset es demasiado grande para procesar en el plan gratuito."
             print(error_msg)
-            return JsonResponse({'error': error_msg}, status=400)
+            return OrjsonResponse({'error': error_msg}, status=400)
             
         except Exception as e:
             error_trace = traceback.format_exc()
             print(f"Error durante el procesamiento: {str(e)}")
-            return JsonResponse({
+            return OrjsonResponse({
                 'error': str(e),
                 'traceback': error_trace
             }, status=400)
     
-    return JsonResponse({'error': 'Método no permitido'}, status=405)
+    return OrjsonResponse({'error': 'Método no permitido'}, status=405)
 
 @csrf_exempt
 def health_check(request):
     """Endpoint de salud para verificar que el backend funciona"""
-    return JsonResponse({
+    return OrjsonResponse({
         'status': 'success', 
         'message': 'Backend funcionando correctamente',
         'timestamp': '2024-01-01T00:00:00Z'
     })
 
-def train_val_test_split_optimized(df, rstate=42, shuffle=True, stratify=None):
-    """División optimizada para memoria"""
-    strat = df[stratify] if stratify else None
+def histogram_image(request, file_hash, split):
+    """Servir la imagen de un histograma del archivo `file_hash`
+    
+    La caché es solo un atajo: si la imagen no está (otro worker, reinicio o expulsada
+    del LRU) se re-dibuja con los conteos que trae la URL."""
+    if split not in HISTOGRAM_STYLES:
+        return OrjsonResponse({'error': 'Histograma no disponible'}, status=404)
+    
+    entry = get_cached_entry(file_hash)
+    image = entry['histograms'].get(split) if entry is not None else None
+    if image is None:
+        params = histogram_params(request.GET)
+        if params is None:
+            return OrjsonResponse({'error': 'Parámetros de histograma inválidos'}, status=400)
+        labels, counts, column = params
+        image = render_histogram(split, labels, counts, column)
+    
+    response = HttpResponse(image, content_type='image/webp')
+    # El contenido depende solo del hash del archivo: el navegador puede guardarlo para siempre
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def histogram_params(query):
+    """Etiquetas, conteos y columna de la URL de un histograma; None si no son válidos
     
-    # Usar índices en lugar de copiar datos cuando sea posible
-    train_set, test_set = train_test_split(
-        df, test_size=0.4, random_state=rstate, shuffle=shuffle, stratify=strat)
+    La URL es pública: se limitan barras, largo de los textos y tamaño de los conteos."""
+    labels = query.getlist('label')
+    raw_counts = query.getlist('count')
+    column = query.get('column', '')
+    if not column or not labels or len(labels) != len(raw_counts) or len(labels) > HISTOGRAM_MAX_BARS:
+        return None
+    if any(len(text) > HISTOGRAM_MAX_LABEL for text in [column, *labels]):
+        return None
+    try:
+        counts = [int(count) for count in raw_counts]
+    except ValueError:
+        return None
+    if not all(0 <= count <= HISTOGRAM_MAX_COUNT for count in counts):
+        return None
+    return labels, counts, column
 
-    strat = test_set[stratify] if stratify else None
-    val_set, test_set = train_test_split(
-        test_set, test_size=0.5, random_state=rstate, shuffle=shuffle, stratify=strat)
+def train_val_test_split_optimized(n_rows, rstate=42, shuffle=True, stratify=None):
+    """División estratificada 60/20/20 en una sola pasada: regresa arreglos de índices
+    
+    Equivale a los dos train_test_split (0.4 y luego 0.5 del resto) pero agrupa las filas
+    por clase una sola vez y corta cada grupo en las tres partes."""
+    # Generator PCG64 con semilla explícita: reproducible y más rápido que RandomState (MT19937)
+    rng = np.random.default_rng(rstate)
+    
+    if n_rows == 0:
+        raise Exception("El dataset está vacío: no hay instancias para dividir")
+    
+    if stratify is None or np.all(stratify == stratify[0]):
+        # Sin estratificar (o una sola clase): un solo grupo con todas las filas
+        groups = [np.arange(n_rows)]
+    else:
+        # Agrupar los índices por clase con un argsort estable sobre los códigos
+        order = np.argsort(stratify, kind='stable')
+        _, class_sizes = np.unique(stratify[order], return_counts=True)
+        groups = np.split(order, np.cumsum(class_sizes)[:-1])
+    
+    # Tamaños globales como en train_test_split (test = ceil), repartidos entre las clases
+    class_sizes = np.array([len(group) for group in groups])
+    n_train = n_rows - int(np.ceil(0.4 * n_rows))
+    n_rest = n_rows - n_train
+    n_val = n_rest - int(np.ceil(0.5 * n_rest))
+    train_sizes = allocate_split(class_sizes, n_train / n_rows, n_train)
+    rest_sizes = class_sizes - train_sizes
+    val_sizes = allocate_split(rest_sizes, n_val / n_rest if n_rest else 0, n_val)
+    
+    parts = ([], [], [])
+    for group, n_tr, n_va in zip(groups, train_sizes, val_sizes):
+        if shuffle:
+            group = rng.permutation(group)
+        parts[0].append(group[:n_tr])
+        parts[1].append(group[n_tr:n_tr + n_va])
+        parts[2].append(group[n_tr + n_va:])
     
-    return train_set, val_set, test_set
+    train_idx, val_idx, test_idx = (np.concatenate(part) for part in parts)
+    return train_idx, val_idx, test_idx
 
-def generate_optimized_results(train_set, val_set, test_set, stratify_col='protocol_type'):
+def allocate_split(class_sizes, fraction, total):
+    """Repartir `total` filas entre las clases en proporción (método del mayor residuo)"""
+    exact = class_sizes * fraction
+    sizes = np.floor(exact).astype(np.int64)
+    remainder = total - sizes.sum()
+    if remainder > 0:
+        sizes[np.argsort(sizes - exact, kind='stable')[:remainder]] += 1
+    return sizes
+
+def category_counts(codes, n_categories):
+    """Frecuencia por categoría usando np.bincount sobre los códigos (sin hashear strings)"""
+    # Los valores faltantes tienen código -1 y no se cuentan
+    return np.bincount(codes[codes >= 0], minlength=n_categories)
+
+def generate_optimized_results(splits, codes, categories, features_count, stratify_col='protocol_type'):
     """Generar resultados optimizados para memoria"""
+    train_idx, val_idx, test_idx = splits
     try:
+        # Un conteo sobre la columna completa; test se obtiene por complemento
+        n_categories = len(categories)
+        original = category_counts(codes, n_categories)
+        train = category_counts(codes[train_idx], n_categories)
+        validation = category_counts(codes[val_idx], n_categories)
+        test = original - train - validation
+        split_counts = {'original': original, 'train': train, 'validation': validation, 'test': test}
+        # Los conteos quedan como escalares numpy; orjson los serializa directamente
+        distribution = {name: dict(zip(categories, counts)) for name, counts in split_counts.items()}
         results = {
             'split_sizes': {
-                'train': len(train_set),
-                'validation': len(val_set),
-                'test': len(test_set)
-            },
-            'protocol_type_distribution': {
-                # Agregar dataset original (concatenado)
-                'original': pd.concat([train_set, val_set, test_set])[stratify_col].value_counts().to_dict(),
-                'train': train_set[stratify_col].value_counts().to_dict(),
-                'validation': val_set[stratify_col].value_counts().to_dict(),
-                'test': test_set[stratify_col].value_counts().to_dict()
+                'train': len(train_idx),
+                'validation': len(val_idx),
+                'test': len(test_idx)
             },
-            'histograms': generate_optimized_histograms(train_set, val_set, test_set, stratify_col),
+            'protocol_type_distribution': distribution,
+            'histograms': generate_optimized_histograms(categories, split_counts, stratify_col),
             'dataset_info': {
-                'total_instances': len(train_set) + len(val_set) + len(test_set),
-                'features_count': len(train_set.columns),
+                'total_instances': len(codes),
+                'features_count': features_count,
                 'stratify_column_used': stratify_col
             }
         }
@@ -168,233 +445,342 @@ def generate_optimized_results(train_set, val_set, test_set, stratify_col='proto
         }
     return results
 
-def generate_optimized_histograms(train_set, val_set, test_set, stratify_col='protocol_type'):
-    """Generar histogramas optimizados"""
-    histograms = {}
-    plt.switch_backend('Agg')
-    fig_size = (8, 4)
-    dpi = 80
-    
+def generate_optimized_histograms(categories, split_counts, stratify_col='protocol_type'):
+    """Generar histogramas optimizados (bytes WebP por conjunto)"""
+    # Con los mismos límites que histogram_image, para que sus URLs se puedan re-dibujar
+    if len(categories) > HISTOGRAM_MAX_BARS:
+        print(f"Demasiadas categorías para graficar: {len(categories)}")
+        return {}
+    labels = [chart_text(category) for category in categories]
+    column = chart_text(stratify_col)
     try:
-        # TRAIN
-        plt.figure(figsize=fig_size, dpi=dpi)
-        train_set[stratify_col].value_counts().plot(kind='bar', color='skyblue')
-        plt.title(f'Training Set - {stratify_col}')
-        plt.xlabel(stratify_col)
-        plt.ylabel('Frecuencia')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        histograms['train'] = plot_to_base64(plt, dpi=dpi)
-        plt.close()
-
-        # VALIDATION
-        plt.figure(figsize=fig_size, dpi=dpi)
-        val_set[stratify_col].value_counts().plot(kind='bar', color='orange')
-        plt.title(f'Validation Set - {stratify_col}')
-        plt.xlabel(stratify_col)
-        plt.ylabel('Frecuencia')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        histograms['validation'] = plot_to_base64(plt, dpi=dpi)
-        plt.close()
-
-        # TEST
-        plt.figure(figsize=fig_size, dpi=dpi)
-        test_set[stratify_col].value_counts().plot(kind='bar', color='lightgreen')
-        plt.title(f'Test Set - {stratify_col}')
-        plt.xlabel(stratify_col)
-        plt.ylabel('Frecuencia')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        histograms['test'] = plot_to_base64(plt, dpi=dpi)
-        plt.close()
+        # En serie: el dibujo con ImageDraw/FreeType retiene el GIL y un pool de hilos por
+        # request solo agrega overhead (Render da una fracción de CPU)
+        histograms = {
+            split: render_histogram(split, labels, split_counts[split], column)
+            for split in HISTOGRAM_STYLES
+        }
     except Exception as e:
         print(f"Error generando histogramas: {e}")
-        histograms = {'train': '', 'validation': '', 'test': ''}
+        histograms = {}
 
     return histograms
 
-def load_kdd_dataset_from_content(content):
-    """Cargar dataset con métodos robustos para NSL-KDD"""
-    try:
-        # Primero intentar carga normal
-        return load_kdd_dataset_normal(content)
-    except Exception as e1:
-        print(f"=== FALLO CARGA NORMAL: {str(e1)} ===")
+def chart_text(value):
+    """Texto de una etiqueta o título de gráfica, recortado a HISTOGRAM_MAX_LABEL caracteres"""
+    text = str(value)
+    if len(text) > HISTOGRAM_MAX_LABEL:
+        text = text[:HISTOGRAM_MAX_LABEL - 1] + '…'
+    return text
+
+def render_histogram(split, labels, counts, stratify_col):
+    """Histograma de un conjunto (train/validation/test) con su título y color"""
+    title, color = HISTOGRAM_STYLES[split]
+    return render_bar_chart(labels, counts, f'{title} - {stratify_col}', stratify_col, color)
+
+@lru_cache(maxsize=1)
+def chart_base():
+    """Lienzo con las partes fijas de la gráfica (ejes y etiqueta Y), creado una vez por proceso"""
+    width, height = CHART_SIZE
+    left, right, top, bottom = CHART_MARGINS
+    base = height - bottom
+
+    image = Image.new('RGB', CHART_SIZE, 'white')
+    draw = ImageDraw.Draw(image)
+    draw.line([(left, top), (left, base), (width - right, base)], fill='black')
+    draw.text((8, top - 16), 'Frecuencia', font=CHART_FONT, fill='black', anchor='ls')
+    return image
+
+def render_bar_chart(labels, counts, title, xlabel, color):
+    """Dibujar la gráfica de barras directamente con Pillow (sin matplotlib) y regresar WebP"""
+    width, height = CHART_SIZE
+    left, right, top, bottom = CHART_MARGINS
+    plot_w, plot_h = width - left - right, height - top - bottom
+    base = top + plot_h
+    font, title_font = CHART_FONT, CHART_TITLE_FONT
+
+    # Copia del lienzo base: solo se dibuja lo que depende de los datos
+    image = chart_base().copy()
+    draw = ImageDraw.Draw(image)
+
+    # Geometría de las barras calculada con numpy
+    counts = np.asarray(counts, dtype=np.float64)
+    peak = counts.max() if counts.size and counts.max() > 0 else 1
+    scale = plot_h / (peak * 1.1)  # margen arriba de la barra más alta para su etiqueta
+    slot = plot_w / max(counts.size, 1)
+    x0 = left + np.arange(counts.size) * slot + slot * 0.1
+    x1 = x0 + slot * 0.8
+    y0 = base - counts * scale
+
+    # Líneas guía y etiquetas del eje Y
+    for tick in np.linspace(0, peak, 5):
+        y = base - tick * scale
+        if tick:  # la línea del 0 es el eje X, ya dibujado en el lienzo base
+            draw.line([(left + 1, y), (left + plot_w, y)], fill=(225, 225, 225))
+        draw.text((left - 6, y), f'{tick:,.0f}', font=font, fill='black', anchor='rm')
+
+    for label, count, a, b, y in zip(labels, counts, x0, x1, y0):
+        draw.rectangle([a, y, b, base], fill=color, outline='black')
+        draw.text(((a + b) / 2, y - 3), f'{count:,.0f}', font=font, fill='black', anchor='md')
+        draw.text(((a + b) / 2, base + 6), str(label), font=font, fill='black', anchor='ma')
+
+    # Títulos
+    draw.text((width / 2, 18), title, font=title_font, fill='black', anchor='mm')
+    draw.text((left + plot_w / 2, height - 14), xlabel, font=font, fill='black', anchor='mm')
+
+    buffer = BytesIO()
+    # WebP sin pérdida: ~3.5x más chico que el PNG equivalente para gráficas de colores planos
+    image.save(buffer, format='WEBP', lossless=True, quality=80, method=4)
+    return buffer.getvalue()
+
+def iter_upload_lines(file, chunk_size=64 * 1024):
+    """Iterar las líneas del archivo subido decodificando chunk por chunk"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    # chunks() regresa al inicio del archivo, así cada intento de carga puede volver a leerlo
+    for chunk in file.chunks(chunk_size=chunk_size):
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        yield from lines
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+def arff_dtypes(attributes):
+    """Mapear tipos ARFF a dtypes compactos de pandas (evita columnas object/float64)"""
+    dtypes = {}
+    for name, kind in attributes:
+        if isinstance(kind, list):
+            # Conservar las categorías declaradas en el header (códigos int8 en lugar de strings)
+            dtypes[name] = pd.CategoricalDtype(categories=kind)
+        elif kind.upper() in ('NUMERIC', 'REAL', 'INTEGER'):
+            dtypes[name] = 'float32'
+        elif name in NSL_KDD_NOMINAL:
+            # Columnas nominales de KDD declaradas como STRING: category igualmente
+            dtypes[name] = 'category'
+    return dtypes
+
+def as_categorical(series):
+    """Columna nominal como category (códigos enteros para estratificar sin hashear strings)"""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    return series
+
+def load_kdd_dataset_from_file(file):
+    """Cargar dataset con métodos robustos para NSL-KDD
+    
+    Prueba cada método en orden y regresa el primero que funcione; si todos fallan,
+    lanza un solo error con el mensaje de cada intento."""
+    errors = []
+    loaders = (
+        # Ruta rápida: header con regex y datos con el tokenizador en C de pandas
+        ('CARGA RÁPIDA', lambda: load_mapped(file, parse_arff_fast)),
+        ('CARGA NORMAL', lambda: load_kdd_dataset_normal(iter_upload_lines(file))),
+        # La carga permisiva reporta el error de la carga normal (el último registrado)
+        ('CARGA PERMISIVA', lambda: load_kdd_dataset_permissive(iter_upload_lines(file), errors[-1])),
+        ('CARGA NSL-KDD', lambda: load_mapped(file, load_nsl_kdd_dataset)),
+    )
+    for name, loader in loaders:
         try:
-            # Segundo intento: carga permisiva
-            return load_kdd_dataset_permissive(content, str(e1))
-        except Exception as e2:
-            print(f"=== FALLO CARGA PERMISIVA: {str(e2)} ===")
-            try:
-                # Tercer intento: carga específica NSL-KDD
-                return load_nsl_kdd_dataset(content)
-            except Exception as e3:
-                print(f"=== FALLO TODOS LOS MÉTODOS ===")
-                raise Exception(f"No se pudo cargar el archivo ARFF. Errores:\n1. {e1}\n2. {e2}\n3. {e3}")
-
-def load_kdd_dataset_normal(content):
-    """Carga normal de ARFF"""
-    dataset = arff.loads(content)
+            return loader()
+        except Exception as e:
+            print(f"=== FALLO {name}: {str(e)} ===")
+            errors.append(str(e))
+    
+    print(f"=== FALLO TODOS LOS MÉTODOS ===")
+    details = '\n'.join(f"{i}. {error}" for i, error in enumerate(errors))
+    raise Exception(f"No se pudo cargar el archivo ARFF. Errores:\n{details}")
+
+def load_mapped(file, loader):
+    """Aplicar `loader` al mmap del archivo subido (o a la subida misma si está en memoria)"""
+    with mapped_upload(file) as source:
+        return loader(source)
+
+@contextmanager
+def mapped_upload(file):
+    """mmap del archivo temporal de la subida; si la subida está en memoria se usa tal cual"""
+    if not hasattr(file, 'temporary_file_path'):
+        yield file
+        return
+    with open(file.temporary_file_path(), 'rb') as handle:
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+def parse_arff_header_line(line):
+    """Regresar (nombre, tipo) de una línea @attribute; el tipo nominal es la lista de valores"""
+    match = ARFF_ATTRIBUTE_RE.match(line)
+    if not match:
+        raise Exception(f"Atributo ARFF inválido: {line}")
+    name, kind = match.group(1).strip('\'"'), match.group(2).strip()
+    if kind.startswith('{'):
+        values = next(csv.reader([kind.strip('{} ')], quotechar="'", skipinitialspace=True))
+        return name, [value.strip().strip('"') for value in values]
+    if kind.upper() not in ('NUMERIC', 'REAL', 'INTEGER', 'STRING'):
+        raise Exception(f"Tipo de atributo no soportado en carga rápida: {kind}")
+    return name, kind.upper()
+
+def arff_schema(attribute_lines):
+    """Nombres y dtypes para read_csv a partir de las líneas @attribute de un header ARFF"""
+    attributes = [parse_arff_header_line(line) for line in attribute_lines]
+    names = [name for name, _ in attributes]
+    declared = arff_dtypes(attributes)
+    # Nominales se leen como category libre y luego se validan contra lo declarado
+    read_dtypes = {name: 'category' if isinstance(dtype, pd.CategoricalDtype) else dtype
+                   for name, dtype in declared.items()}
+    return names, read_dtypes, declared
+
+def read_arff_header(file):
+    """Leer el header línea por línea hasta @DATA; regresa las líneas @attribute
+    
+    El archivo queda posicionado al inicio de la sección de datos."""
+    file.seek(0)
+    attribute_lines = []
+    while True:
+        raw = file.readline()
+        if not raw:
+            raise Exception("No se encontró la sección @DATA en el archivo")
+        line = raw.decode('utf-8').strip()
+        if not line or line.startswith('%'):
+            continue
+        upper = line.upper()
+        if upper == '@DATA':
+            return attribute_lines
+        if upper.startswith('@ATTRIBUTE'):
+            attribute_lines.append(line)
+
+def parse_arff_fast(file):
+    """Carga rápida de ARFF: header con regex y sección @DATA con pd.read_csv (motor C)
+    
+    `file` puede ser la subida de Django o un mmap del archivo temporal."""
+    attribute_lines = read_arff_header(file)
+    if not attribute_lines:
+        raise Exception("El header no declara atributos")
+    names, read_dtypes, declared = arff_schema(attribute_lines)
+    
+    # Validar el número de campos con la primera fila (read_csv rellena o recorta en silencio)
+    data_start = file.tell()
+    for raw in iter(file.readline, b''):
+        line = raw.decode('utf-8').strip()
+        if line and not line.startswith('%'):
+            fields = next(csv.reader([line], quotechar="'", skipinitialspace=True))
+            if len(fields) != len(names):
+                raise Exception(f"Se esperaban {len(names)} columnas y la primera fila tiene {len(fields)}")
+            break
+    file.seek(data_start)
+    
+    df = pd.read_csv(file, names=names, dtype=read_dtypes, **ARFF_CSV_OPTIONS)
+    
+    if df.empty:
+        raise Exception("El dataset está vacío")
+    
+    for name, dtype in declared.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            unknown = set(df[name].cat.categories) - set(dtype.categories)
+            if unknown:
+                raise Exception(f"Valores no declarados en '{name}': {sorted(map(str, unknown))[:5]}")
+            df[name] = df[name].cat.set_categories(dtype.categories)
+    
+    return df
+
+def load_kdd_dataset_normal(lines):
+    """Carga normal de ARFF (fila por fila, sin lista intermedia de liac-arff)"""
+    dataset = arff.load(lines, return_type=arff.DENSE_GEN)
     attributes = [attr[0] for attr in dataset['attributes']]
     
-    if not dataset['data']:
+    df = pd.DataFrame.from_records(dataset['data'], columns=attributes)
+    if df.empty:
         raise Exception("El dataset está vacío")
         
-    return pd.DataFrame(dataset['data'], columns=attributes)
+    return df.astype(arff_dtypes(dataset['attributes']), copy=False)
 
-def load_kdd_dataset_permissive(content, original_error):
+def load_kdd_dataset_permissive(lines, original_error):
     """Cargar dataset NSL-KDD con formato más permisivo"""
     try:
         print("=== INTENTANDO CARGA PERMISIVA ===")
         
-        lines = content.split('\n')
-        cleaned_lines = []
-        
-        # Limpiar el archivo línea por línea
-        for i, line in enumerate(lines):
+        # Separar el header (hasta @DATA); las líneas de datos no se tocan
+        header_lines = []
+        for line in lines:
             line = line.strip()
-            
-            # Saltar líneas vacías
-            if not line:
-                continue
-                
-            # Manejar atributos problemáticos
-            if line.lower().startswith('@attribute'):
-                # Corregir problemas comunes en NSL-KDD
-                if 'string' in line.lower():
-                    line = line.replace('string', 'STRING')
-                if 'real' in line.lower():
-                    line = line.replace('real', 'NUMERIC')
-                if 'integer' in line.lower():
-                    line = line.replace('integer', 'NUMERIC')
-                
-                # Asegurar formato correcto para nominales
-                if '{' in line and '}' in line:
-                    # Ya es un atributo nominal, dejarlo como está
-                    pass
-                elif 'protocol_type' in line.lower():
-                    line = '@ATTRIBUTE protocol_type {tcp,udp,icmp}'
-                elif 'service' in line.lower():
-                    line = '@ATTRIBUTE service {http,ftp,smtp,ssh,dns,other}'
-                elif 'flag' in line.lower():
-                    line = '@ATTRIBUTE flag {SF,S1,S2,S3,S0,OTH}'
-                elif 'land' in line.lower():
-                    line = '@ATTRIBUTE land {0,1}'
-                elif 'logged_in' in line.lower():
-                    line = '@ATTRIBUTE logged_in {0,1}'
-                elif 'is_host_login' in line.lower():
-                    line = '@ATTRIBUTE is_host_login {0,1}'
-                elif 'is_guest_login' in line.lower():
-                    line = '@ATTRIBUTE is_guest_login {0,1}'
-            
-            cleaned_lines.append(line)
+            if line:
+                header_lines.append(line)
+            if ARFF_DATA_RE.match(line):
+                break
         
-        # Reconstruir contenido limpio
-        cleaned_content = '\n'.join(cleaned_lines)
+        # Corregir problemas comunes en NSL-KDD solo sobre el header
+        header = '\n'.join(header_lines)
+        for pattern, replacement in ARFF_ATTRIBUTE_FIXES:
+            header = pattern.sub(replacement, header)
         
-        print("=== CONTENIDO LIMPIO (primeras 20 líneas) ===")
-        print('\n'.join(cleaned_lines[:20]))
-        print("=== FIN CONTENIDO LIMPIO ===")
+        print("=== HEADER LIMPIO ===")
+        print(header)
+        print("=== FIN HEADER LIMPIO ===")
         
-        # Intentar cargar el contenido limpio
-        dataset = arff.loads(cleaned_content)
+        # Intentar cargar el contenido limpio (el resto de líneas pasa directo al parser)
+        dataset = arff.load(chain(header.split('\n'), lines))
         attributes = [attr[0] for attr in dataset['attributes']]
         
         print(f"=== CARGA PERMISIVA EXITOSA ===")
         print(f"Atributos: {attributes}")
         print(f"Número de instancias: {len(dataset['data'])}")
         
-        return pd.DataFrame(dataset['data'], columns=attributes)
+        df = pd.DataFrame(dataset['data'], columns=attributes)
+        if df.empty:
+            raise Exception("El dataset está vacío")
+        
+        return df.astype(arff_dtypes(dataset['attributes']), copy=False)
         
     except Exception as e:
         print(f"=== FALLA EN CARGA PERMISIVA ===")
         print(f"Error: {str(e)}")
         raise Exception(f"No se pudo cargar el archivo ARFF. Error original: {original_error}. Error en carga permisiva: {str(e)}")
 
-def load_nsl_kdd_dataset(content):
-    """Cargar específicamente datasets NSL-KDD"""
+def load_nsl_kdd_dataset(file):
+    """Cargar específicamente datasets NSL-KDD (esquema fijo, datos con pd.read_csv)"""
     try:
         print("=== INTENTANDO CARGA ESPECÍFICA NSL-KDD ===")
         
         # Saltar directamente a los datos si el header tiene problemas
-        lines = content.split('\n')
-        
-        # Buscar la línea @DATA
-        data_start = None
-        for i, line in enumerate(lines):
-            if line.strip().upper() == '@DATA':
-                data_start = i + 1
-                break
-        
-        if data_start is None:
-            raise Exception("No se encontró la sección @DATA en el archivo")
+        read_arff_header(file)
+        data_start = file.tell()
         
-        # Atributos predefinidos para NSL-KDD (basado en KDDTest+.arff)
-        attributes = [
-            'duration', 'protocol_type', 'service', 'flag', 'src_bytes', 
-            'dst_bytes', 'land', 'wrong_fragment', 'urgent', 'hot',
-            'num_failed_logins', 'logged_in', 'num_compromised', 'root_shell',
-            'su_attempted', 'num_root', 'num_file_creations', 'num_shells',
-            'num_access_files', 'num_outbound_cmds', 'is_host_login',
-            'is_guest_login', 'count', 'srv_count', 'serror_rate',
-            'srv_serror_rate', 'rerror_rate', 'srv_rerror_rate', 'same_srv_rate',
-            'diff_srv_rate', 'srv_diff_host_rate', 'dst_host_count',
-            'dst_host_srv_count', 'dst_host_same_srv_rate', 'dst_host_diff_srv_rate',
-            'dst_host_same_src_port_rate', 'dst_host_srv_diff_host_rate',
-            'dst_host_serror_rate', 'dst_host_srv_serror_rate', 'dst_host_rerror_rate',
-            'dst_host_srv_rerror_rate', 'class'
-        ]
-        
-        # Leer los datos
-        data_lines = []
-        for line in lines[data_start:]:
-            line = line.strip()
-            if line and not line.startswith('%'):  # Saltar líneas vacías y comentarios
-                data_lines.append(line)
+        # Se lee una columna centinela de más: las filas con 44+ campos se descartan aquí y
+        # las de 43 (centinela llena) o incompletas más abajo; las comillas simples se limpian
+        names = NSL_KDD_ATTRIBUTES + [NSL_KDD_EXTRA_FIELD]
+        try:
+            df = pd.read_csv(file, names=names, dtype={**NSL_KDD_DTYPES, NSL_KDD_EXTRA_FIELD: str},
+                             on_bad_lines='skip', **ARFF_CSV_OPTIONS)
+        except ValueError as e:
+            # Alguna columna numérica trae texto: leer sin forzar tipos y convertir de forma
+            # vectorizada (los valores no numéricos quedan como NaN)
+            print(f"Columnas numéricas con texto, convirtiendo con pd.to_numeric: {e}")
+            file.seek(data_start)
+            df = pd.read_csv(file, names=names,
+                             dtype={**{col: 'category' for col in NSL_KDD_NOMINAL}, NSL_KDD_EXTRA_FIELD: str},
+                             on_bad_lines='skip', **ARFF_CSV_OPTIONS)
+            numeric = [col for col in NSL_KDD_ATTRIBUTES if col not in NSL_KDD_NOMINAL]
+            df[numeric] = df[numeric].apply(pd.to_numeric, errors='coerce').astype('float32')
         
-        # Parsear los datos
-        data = []
-        for line in data_lines:
-            values = line.split(',')
-            if len(values) == len(attributes):
-                # Convertir valores numéricos
-                processed_values = []
-                for i, value in enumerate(values):
-                    value = value.strip().strip("'\"")  # Remover comillas
-                    if value.replace('.', '').replace('-', '').isdigit():
-                        try:
-                            if '.' in value:
-                                processed_values.append(float(value))
-                            else:
-                                processed_values.append(int(value))
-                        except:
-                            processed_values.append(value)
-                    else:
-                        processed_values.append(value)
-                data.append(processed_values)
+        # read_csv rellena las filas cortas con '' (keep_default_na=False): igual que el
+        # filtro original de 42 campos, se descartan las filas sin la última columna y
+        # las que llenaron la columna centinela
+        last = df[NSL_KDD_ATTRIBUTES[-1]]
+        complete = last.notna() & (last != '') & (df.pop(NSL_KDD_EXTRA_FIELD) == '')
+        if not complete.all():
+            print(f"Filas con un número de campos distinto de 42 descartadas: {(~complete).sum()}")
+            df = df[complete].reset_index(drop=True)
+            # Quitar la categoría '' que dejaron las filas descartadas
+            for col in NSL_KDD_NOMINAL:
+                df[col] = df[col].cat.remove_unused_categories()
         
-        if not data:
+        if df.empty:
             raise Exception("No se pudieron cargar datos del archivo")
         
         print(f"=== CARGA NSL-KDD EXITOSA ===")
-        print(f"Instancias cargadas: {len(data)}")
-        print(f"Atributos: {len(attributes)}")
+        print(f"Instancias cargadas: {len(df)}")
+        print(f"Atributos: {len(NSL_KDD_ATTRIBUTES)}")
         
-        return pd.DataFrame(data, columns=attributes)
+        return df
         
     except Exception as e:
-        raise Exception(f"Error cargando dataset NSL-KDD: {str(e)}")
-
-def plot_to_base64(plt, dpi=80):
-    """Convertir plot a base64 optimizado"""
-    try:
-        buffer = BytesIO()
-        # Quitar optimize=True (no válido)
-        plt.savefig(buffer, format='png', bbox_inches='tight', dpi=dpi)
-        buffer.seek(0)
-        image_png = buffer.getvalue()
-        buffer.close()
-        return base64.b64encode(image_png).decode('utf-8')
-    except Exception as e:
-        raise Exception(f"Error convirtiendo plot a base64: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error cargando dataset NSL-KDD: {str(e)}")
\ No newline at end of file
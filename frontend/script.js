@@ -230,12 +230,13 @@ function displayHistograms(histograms) {
     const container = document.getElementById('histograms');
     container.innerHTML = '';
     
-    for (const [setName, base64Image] of Object.entries(histograms)) {
+    // El backend regresa la URL de cada imagen (ya no la imagen en base64)
+    for (const [setName, imageUrl] of Object.entries(histograms)) {
         const div = document.createElement('div');
         div.className = 'histogram-item';
         div.innerHTML = `
             <h4>${getSetDisplayName(setName)}</h4>
-            <img src="data:image/png;base64,${base64Image}" alt="Histograma de ${setName}">
+            <img src="${imageUrl}" alt="Histograma de ${setName}">
         `;
         container.appendChild(div);
     }